@@ -7,6 +7,8 @@ NCSL AI + Energy/Utilities Legislation Watcher
 - Filters to bills relevant to energy/utilities / grid / data centers.
 - Every run:
     * If < DIGEST_DAYS since last email digest -> exit silently.
+    * If the page is unchanged since the last check (HTTP 304, or the
+      same body hash) and the keyword list is too -> exit silently.
     * Otherwise, compute "new since last digest" and send an email
       ONLY if there are new relevant bills.
 - State is tracked in a JSON file in the repo.
@@ -22,21 +24,43 @@ Config via environment variables (GitHub Actions secrets are passed as env):
 
 import os
 import time
+import atexit
+import hashlib
 import json
 import ssl
 import smtplib
-from typing import List, Dict, Set, Optional
+from collections import defaultdict
+from contextlib import ExitStack
+from itertools import compress
+from typing import List, Dict, Optional, Tuple
 from email.mime.text import MIMEText
 from urllib.parse import urljoin
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 
 try:
     import cloudscraper  # type: ignore
 except ImportError:
     cloudscraper = None  # we’ll handle this gracefully
 
+try:
+    import ahocorasick  # type: ignore
+except ImportError:
+    ahocorasick = None  # fall back to a plain substring scan
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # stdlib json works, just slower
+
+try:
+    import brotli  # type: ignore  # lets urllib3 decode Content-Encoding: br
+except ImportError:
+    brotli = None  # stick to gzip/deflate
+
 # --------------------------------------------------------------------
 # Constants / config
 # --------------------------------------------------------------------
@@ -80,6 +104,27 @@ def make_headers(ua: str) -> Dict[str, str]:
     h["User-Agent"] = ua
     return h
 
+# One pooled session for all plain-requests fetches, so fallbacks and
+# retries reuse the TCP+TLS connection to ncsl.org instead of redialing.
+SESSION = requests.Session()
+SESSION.headers.update(BASE_HEADERS)
+SESSION.headers["Accept-Encoding"] = (
+    "br, gzip, deflate" if brotli is not None else "gzip, deflate"
+)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    ),
+)
+atexit.register(SESSION.close)
+
 # For grouping in the email
 NE_PLUS_NY = [
     "Connecticut",
@@ -90,6 +135,7 @@ NE_PLUS_NY = [
     "Vermont",
     "New York",
 ]
+NE_SET = frozenset(NE_PLUS_NY)
 
 # =======================
 # OCC-TUNED KEYWORD GROUPS
@@ -140,42 +186,106 @@ ALL_KEYWORDS = (
     CLIMATE_POLICY
 )
 
+# Display names for the groups above, in the order the email lists them
+KEYWORD_GROUPS = {
+    "Core utility": CORE_UTILITY,
+    "Data center infrastructure": DATA_CENTER_INFRA,
+    "Consumer protection": CONSUMER_PROTECTION,
+    "Climate policy": CLIMATE_POLICY,
+}
+GROUP_ORDER = {name: i for i, name in enumerate(KEYWORD_GROUPS)}
+
+# Lowercased, de-duplicated keywords, longest first. Normalized once here
+# so the matchers below never re-lowercase keywords per bill.
+_KW_LOWER = tuple(sorted({kw.lower() for kw in ALL_KEYWORDS}, key=lambda kw: (-len(kw), kw)))
+
+# Fingerprint of the keyword set, stored with the page validators: a page
+# checked under different keywords must be re-parsed even if it's unchanged.
+KEYWORDS_MD5 = hashlib.md5("\n".join(_KW_LOWER).encode("utf-8")).hexdigest()
+
+# Lowercased keyword -> names of every group that lists it, in GROUP_ORDER
+_KW_GROUPS: Dict[str, Tuple[str, ...]] = {}
+for _name, _words in KEYWORD_GROUPS.items():
+    for _kw in {w.lower() for w in _words}:
+        _KW_GROUPS[_kw] = _KW_GROUPS.get(_kw, ()) + (_name,)
+
+# Aho-Corasick automaton over every keyword, built once at import so each
+# bill is scanned in a single pass regardless of how many keywords we track.
+# Each keyword carries its group names, so the same scan can tag bills.
+KW_AUTOMATON = None
+if ahocorasick is not None:
+    KW_AUTOMATON = ahocorasick.Automaton()
+    for kw in _KW_LOWER:
+        KW_AUTOMATON.add_word(kw, _KW_GROUPS[kw])
+    KW_AUTOMATON.make_automaton()
+
 # --------------------------------------------------------------------
 # State helpers
 # --------------------------------------------------------------------
 
 def load_state() -> Dict:
+    state: Dict = {}
     if os.path.exists(STATE_FILE):
         try:
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
+            with open(STATE_FILE, "rb") as f:
+                raw = f.read()
+            state = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses this
             pass
-    return {"seen_ids": [], "last_digest": 0}
 
+    # Older state files only kept a sorted "seen_ids" list.
+    if "bills" not in state:
+        state["bills"] = {bill_id: {} for bill_id in state.pop("seen_ids", [])}
+    state.setdefault("last_digest", 0)
+    return state
 
-def save_state(seen_ids: Set[str], last_digest: int):
+
+def save_state(bills: Dict[str, Dict], last_digest: int, page_cache: Dict[str, str]):
     state = {
-        "seen_ids": sorted(seen_ids),
+        "bills": bills,
         "last_digest": int(last_digest),
+        **page_cache,
     }
     print(f"[STATE] Writing state to {STATE_FILE}")
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+    if orjson is not None:
+        data = orjson.dumps(state, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    else:
+        data = json.dumps(state, indent=2, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    with open(STATE_FILE, "wb") as f:
+        f.write(data)
+
+
+def bill_meta(row: Dict) -> Dict[str, str]:
+    """The part of a scraped row kept in the state snapshot."""
+    return {k: row[k] for k in ("title", "status", "category", "url")}
 
 # --------------------------------------------------------------------
 # Fetch + parse
 # --------------------------------------------------------------------
 
-def fetch_html() -> str:
+def conditional_headers(state: Dict) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since built from the validators saved in state."""
+    h: Dict[str, str] = {}
+    if state.get("etag"):
+        h["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        h["If-Modified-Since"] = state["last_modified"]
+    return h
+
+
+def fetch_html(extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
     """
-    Fetch the NCSL page HTML.
+    Fetch the NCSL page.
+
+    Returns the response on 200, or on 304 when extra_headers carries
+    conditional validators and the page hasn't changed.
 
     Strategy:
     1. If cloudscraper is available, try it with multiple UAs.
     2. Fallback to plain requests with the same UAs.
     3. If all fail, raise with diagnostic status codes.
     """
+    extra_headers = extra_headers or {}
     cloudscraper_status = "n/a"
     requests_status = "n/a"
     last_err: Optional[Exception] = None
@@ -191,10 +301,12 @@ def fetch_html() -> str:
                         "mobile": False,
                     }
                 )
-                resp = scraper.get(PAGE_URL, headers=make_headers(ua), timeout=60)
+                resp = scraper.get(
+                    PAGE_URL, headers={**make_headers(ua), **extra_headers}, timeout=60
+                )
                 cloudscraper_status = resp.status_code
-                if resp.status_code == 200:
-                    return resp.text
+                if resp.status_code in (200, 304):
+                    return resp
                 # if it's a hard 403/429, try next UA
             except Exception as e:
                 last_err = e
@@ -202,10 +314,12 @@ def fetch_html() -> str:
     # 2) plain requests
     for ua in USER_AGENTS:
         try:
-            resp = requests.get(PAGE_URL, headers=make_headers(ua), timeout=60)
+            resp = SESSION.get(
+                PAGE_URL, headers={**make_headers(ua), **extra_headers}, timeout=60
+            )
             requests_status = resp.status_code
-            if resp.status_code == 200:
-                return resp.text
+            if resp.status_code in (200, 304):
+                return resp
         except Exception as e:
             last_err = e
 
@@ -217,39 +331,72 @@ def fetch_html() -> str:
     )
 
 
-def fetch_table_rows() -> List[Dict]:
-    """Scrape the NCSL page and return all rows as dicts."""
-    html = fetch_html()
-    soup = BeautifulSoup(html, "html.parser")
+LEGISLATION_TABLE_SELECTOR = (
+    'table:has(th:lexbor-contains("Jurisdiction and Summary"))'
+    ':has(th:lexbor-contains("Bill Number"))'
+)
+
 
-    # Find table with correct headers
-    target_table = None
-    for table in soup.find_all("table"):
-        headers = [th.get_text(strip=True) for th in table.find_all("th")]
+def _legislation_prefix(html: bytes) -> Optional[bytes]:
+    """
+    The page bytes up to the end of the legislation table, or None.
+
+    Everything after that table is irrelevant, so parsing only this prefix
+    skips the rest of the document. Returns None (parse it all) when the
+    table can't be spotted cheaply or contains a nested table, since then
+    the first </table> wouldn't be its end.
+    """
+    marker = html.find(b"Jurisdiction and Summary")
+    if marker == -1:
+        return None
+    start = html.rfind(b"<table", 0, marker)
+    end = html.find(b"</table>", marker)
+    if start == -1 or end == -1 or html.find(b"<table", start + 1, end) != -1:
+        return None
+    return html[: end + len(b"</table>")]
+
+
+def _find_legislation_table(html: bytes):
+    tree = LexborHTMLParser(html)
+
+    # Find table with correct headers. The selector narrows candidates inside
+    # lexbor (substring match); the exact check below rejects near-misses.
+    for table in tree.css(LEGISLATION_TABLE_SELECTOR):
+        headers = [th.text(strip=True) for th in table.css("th")]
         if "Jurisdiction and Summary" in headers and "Bill Number" in headers:
-            target_table = table
-            break
+            return table
+    return None
+
+
+def parse_table_rows(html: bytes) -> List[Dict]:
+    """Parse the raw NCSL page bytes and return all rows as dicts."""
+    prefix = _legislation_prefix(html)
+    target_table = _find_legislation_table(prefix) if prefix else None
+    if target_table is None:
+        target_table = _find_legislation_table(html)
 
     if not target_table:
         raise RuntimeError("Could not locate legislation table on NCSL page")
 
-    tbody = target_table.find("tbody") or target_table
     rows: List[Dict] = []
-    for tr in tbody.find_all("tr"):
-        cells = tr.find_all("td")
+    for tr in target_table.css("tbody tr"):
+        # Direct <td> children only: cheaper than a CSS descendant match per
+        # row, and a table nested in a cell can't shift the columns.
+        cells = [c for c in tr.iter() if c.tag == "td"]
         if len(cells) < 6:
             continue
 
-        jurisdiction = cells[0].get_text(strip=True)
+        jurisdiction = cells[0].text(strip=True)
         bill_cell = cells[1]
-        link = bill_cell.find("a")
-        bill_number = link.get_text(strip=True) if link else bill_cell.get_text(strip=True)
-        bill_url = urljoin(PAGE_URL, link["href"]) if link and link.get("href") else PAGE_URL
+        link = bill_cell.css_first("a")
+        href = link.attributes.get("href") if link else None
+        bill_number = link.text(strip=True) if link else bill_cell.text(strip=True)
+        bill_url = urljoin(PAGE_URL, href) if href else PAGE_URL
 
-        title = cells[2].get_text(strip=True)
-        status = cells[3].get_text(strip=True)
-        summary = cells[4].get_text(" ", strip=True)
-        category = cells[5].get_text(strip=True)
+        title = cells[2].text(strip=True)
+        status = cells[3].text(strip=True)
+        summary = cells[4].text(separator=" ", strip=True, skip_empty=True)
+        category = cells[5].text(strip=True)
 
         bill_id = f"{jurisdiction}::{bill_number}"
 
@@ -263,6 +410,9 @@ def fetch_table_rows() -> List[Dict]:
                 "summary": summary,
                 "category": category,
                 "url": bill_url,
+                # Lowercased text the keyword filter scans, built while the
+                # fields are at hand. Underscore keys never reach the state file.
+                "_hay": f"{title} {summary} {category}".lower(),
             }
         )
 
@@ -272,41 +422,91 @@ def fetch_table_rows() -> List[Dict]:
 # Filtering + formatting
 # --------------------------------------------------------------------
 
-def is_energy_relevant(row: Dict) -> bool:
-    """Check title + summary + category for energy/utility/data-center/consumer/climate relevance."""
-    text = " ".join(
-        [
-            row.get("title", ""),
-            row.get("summary", ""),
-            row.get("category", ""),
-        ]
-    ).lower()
-
-    for kw in ALL_KEYWORDS:
-        if kw.lower() in text:
+def _automaton_hit(text: str) -> bool:
+    return next(KW_AUTOMATON.iter(text), None) is not None
+
+
+# Shortest first: the generic terms ("grid", "solar", "energy") hit earliest
+_KW_SHORTEST_FIRST = _KW_LOWER[::-1]
+
+
+def _substring_hit(text: str) -> bool:
+    # str.__contains__ runs CPython's fast search per keyword; for a yes/no
+    # answer that beats a compiled alternation, which tries every keyword at
+    # every offset.
+    for kw in _KW_SHORTEST_FIRST:
+        if kw in text:
             return True
     return False
 
 
+# Keyword matcher picked once at import: text -> truthy on the first hit.
+_has_keyword = _automaton_hit if KW_AUTOMATON is not None else _substring_hit
+
+
+def _haystack(row: Dict) -> str:
+    """The row's precomputed "_hay", or the same text built from its fields."""
+    hay = row.get("_hay")
+    if hay is None:
+        hay = " ".join(
+            [
+                row.get("title", ""),
+                row.get("summary", ""),
+                row.get("category", ""),
+            ]
+        ).lower()
+    return hay
+
+
 def filter_relevant(rows: List[Dict]) -> List[Dict]:
-    return [r for r in rows if is_energy_relevant(r)]
+    """Keep rows whose title/summary/category hit an energy-related keyword."""
+    # The matcher was chosen once at import, so there's no per-row branch on
+    # which backend is available; rows from parse_table_rows reuse "_hay".
+    return list(compress(rows, map(_has_keyword, map(_haystack, rows))))
+
+
+def keyword_groups(text: str) -> List[str]:
+    """
+    Names of the keyword groups matched anywhere in text, in GROUP_ORDER.
+
+    Overlapping keywords all count ("energy efficiency" also matches
+    "energy"), with or without the automaton.
+    """
+    if KW_AUTOMATON is not None:
+        found = {g for _, groups in KW_AUTOMATON.iter(text) for g in groups}
+    else:
+        found = {g for kw in _KW_LOWER if kw in text for g in _KW_GROUPS[kw]}
+    return sorted(found, key=GROUP_ORDER.__getitem__)
+
+
+def tag_keyword_groups(rows: List[Dict]) -> None:
+    """
+    Record on each row (as "_groups") which keyword groups it matched.
+
+    Only run on the bills going into the email: the relevance filter stops
+    at the first hit, while tagging needs a full scan of the text.
+    """
+    for r in rows:
+        r["_groups"] = keyword_groups(r["_hay"])
 
 
 def group_by_state(new_rows: List[Dict]):
     """Split new rows into {NE+NY states} and {other states}, each mapping state -> list[rows]."""
-    top: Dict[str, List[Dict]] = {s: [] for s in NE_PLUS_NY}
-    others: Dict[str, List[Dict]] = {}
+    top: Dict[str, List[Dict]] = defaultdict(list)
+    others: Dict[str, List[Dict]] = defaultdict(list)
 
     for r in new_rows:
         state = r["state"]
-        if state in top:
-            top[state].append(r)
-        else:
-            others.setdefault(state, []).append(r)
+        (top if state in NE_SET else others)[state].append(r)
+
+    # Plain dicts, so lookups of absent states don't insert empty lists
+    return dict(top), dict(others)
 
-    # Drop empty states from "top"
-    top = {s: bills for s, bills in top.items() if bills}
-    return top, others
+
+def _group_sort_key(row: Dict) -> int:
+    """Order bills by their first matched keyword group (untagged last)."""
+    groups = row.get("_groups")
+    return GROUP_ORDER[groups[0]] if groups else len(GROUP_ORDER)
 
 
 def format_email(new_rows: List[Dict], last_digest_ts: int) -> str:
@@ -341,9 +541,11 @@ def format_email(new_rows: List[Dict], last_digest_ts: int) -> str:
             lines.append("")
             lines.append(state)
             lines.append("-" * len(state))
-            for b in bills:
+            for b in sorted(bills, key=_group_sort_key):
                 lines.append(f"* {b['bill_number']} – {b['title']} ({b['status']})")
                 lines.append(f"  {b['summary']}")
+                if b.get("_groups"):
+                    lines.append(f"  Matched: {', '.join(b['_groups'])}")
                 lines.append(f"  {b['url']}")
         lines.append("")
 
@@ -355,9 +557,11 @@ def format_email(new_rows: List[Dict], last_digest_ts: int) -> str:
             lines.append("")
             lines.append(state)
             lines.append("-" * len(state))
-            for b in bills:
+            for b in sorted(bills, key=_group_sort_key):
                 lines.append(f"* {b['bill_number']} – {b['title']} ({b['status']})")
                 lines.append(f"  {b['summary']}")
+                if b.get("_groups"):
+                    lines.append(f"  Matched: {', '.join(b['_groups'])}")
                 lines.append(f"  {b['url']}")
         lines.append("")
 
@@ -367,21 +571,45 @@ def format_email(new_rows: List[Dict], last_digest_ts: int) -> str:
 # Email
 # --------------------------------------------------------------------
 
-def send_email(subject: str, body: str):
+def _open_smtp() -> smtplib.SMTP:
+    """Connect, STARTTLS and log in; the caller owns (and closes) the session."""
+    ctx = ssl.create_default_context()
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=60)
+    try:
+        server.starttls(context=ctx)
+        server.login(SMTP_USER, SMTP_PASS)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def send_emails(messages: List[Tuple[str, str]]):
+    """Send (subject, body) pairs over a single SMTP session."""
     if not (SMTP_HOST and SMTP_USER and SMTP_PASS and EMAIL_TO):
         print("Email not configured (missing SMTP_* or EMAIL_TO). Skipping send.")
         return
 
-    msg = MIMEText(body, "plain", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = EMAIL_FROM or SMTP_USER
-    msg["To"] = ", ".join(EMAIL_TO)
+    with ExitStack() as stack:
+        server = stack.enter_context(_open_smtp())
+        for i, (subject, body) in enumerate(messages):
+            msg = MIMEText(body, "plain", "utf-8")
+            msg["Subject"] = subject
+            msg["From"] = EMAIL_FROM or SMTP_USER
+            msg["To"] = ", ".join(EMAIL_TO)
 
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=60) as server:
-        server.starttls(context=ctx)
-        server.login(SMTP_USER, SMTP_PASS)
-        server.sendmail(msg["From"], EMAIL_TO, msg.as_string())
+            # Health-check the session between sends; reconnect if it dropped.
+            if i:
+                try:
+                    server.noop()
+                except smtplib.SMTPServerDisconnected:
+                    server = stack.enter_context(_open_smtp())
+
+            server.sendmail(msg["From"], EMAIL_TO, msg.as_string())
+
+
+def send_email(subject: str, body: str):
+    send_emails([(subject, body)])
 
 # --------------------------------------------------------------------
 # Main
@@ -389,8 +617,8 @@ def send_email(subject: str, body: str):
 
 def main():
     state = load_state()
-    seen_ids = set(state.get("seen_ids", []))
-    last_digest = state.get("last_digest", 0)
+    bills: Dict[str, Dict] = state["bills"]
+    last_digest = state["last_digest"]
 
     now = time.time()
 
@@ -400,32 +628,64 @@ def main():
             print(f"Skipping digest: <{DIGEST_DAYS} days since last email.")
             return
 
+    # Conditional GET: skip the download/parse when the page hasn't changed
+    # since the last run we recorded. FORCE_EMAIL, or a keyword list that
+    # changed since that run, always fetches and parses fresh.
+    use_page_cache = not FORCE_EMAIL and state.get("keywords_md5") == KEYWORDS_MD5
     try:
-        all_rows = fetch_table_rows()
+        resp = fetch_html(conditional_headers(state) if use_page_cache else {})
     except Exception as e:
         # Log a clear error; you could also email yourself here if you want
         print(f"[NCSL AI Watch] ERROR fetching table: {e}")
         return
 
+    if resp.status_code == 304:
+        print("NCSL page not modified since last check; not sending email.")
+        return
+
+    # Servers don't always honour validators with a 304, so also skip whenever
+    # the body hash matches the last recorded one.
+    page_cache = {
+        "etag": resp.headers.get("ETag", ""),
+        "last_modified": resp.headers.get("Last-Modified", ""),
+        "html_md5": hashlib.md5(resp.content).hexdigest(),
+        "keywords_md5": KEYWORDS_MD5,
+    }
+    if use_page_cache and page_cache["html_md5"] == state.get("html_md5"):
+        print("NCSL page unchanged since last check; not sending email.")
+        return
+
+    try:
+        # Hand lexbor the raw bytes; it decodes while tokenizing, so we skip
+        # building a decoded copy of the whole page via resp.text.
+        all_rows = parse_table_rows(resp.content)
+    except Exception as e:
+        print(f"[NCSL AI Watch] ERROR parsing table: {e}")
+        return
+
     relevant = filter_relevant(all_rows)
 
-    # "New since last digest" = relevant IDs not in seen_ids
-    new_rows = [r for r in relevant if r["id"] not in seen_ids]
+    # "New since last digest" = relevant IDs not yet in the bills snapshot
+    new_rows = [r for r in relevant if r["id"] not in bills]
 
     if not new_rows and not FORCE_EMAIL:
         print("No new relevant bills since last digest; not sending email.")
+        # Only the page validators change here; bills and last_digest stay
+        # as of the last digest, so unchanged runs can skip the page.
+        save_state(bills, last_digest, page_cache)
         return
 
     subject_suffix = f"{len(new_rows)} new bill(s)" if new_rows else "Digest (no new bills)"
     subject = f"[NCSL AI+Energy Watch] {subject_suffix}"
 
+    tag_keyword_groups(new_rows)
     body = format_email(new_rows, last_digest)
     print(body)
     send_email(subject, body)
 
-    # Update state ONLY when a digest is actually sent
-    new_seen = seen_ids.union(r["id"] for r in relevant)
-    save_state(new_seen, now)
+    # The bills snapshot and last_digest only move when a digest is sent
+    bills.update((r["id"], bill_meta(r)) for r in relevant)
+    save_state(bills, now, page_cache)
 
 
 if __name__ == "__main__":